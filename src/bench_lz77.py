@@ -0,0 +1,75 @@
+"""
+Benchmark of the LZ77 pre-stage: compression ratio against speed
+for plain Huffman coding and for every LZ77 effort level.
+
+Run from the src directory as:  python bench_lz77.py [FILE ...]
+
+With no FILE, a generated JSON log of 200 KB is used.  The ratio is
+compressed bits / 8 divided by the number of input chars.
+"""
+import json
+import random
+import sys
+import time
+
+from huffman import Huffman
+from lz77 import LZ77
+
+
+def sample_log(num_chars=200000, seed=1):
+    """
+    Return a repeatable JSON lines log of about num_chars chars
+    """
+    rand = random.Random(seed)
+    lines = []
+    size = 0
+    while size < num_chars:
+        line = json.dumps({"ts": 1700000000 + len(lines),
+                           "level": rand.choice(["debug", "info", "warn", "error"]),
+                           "service": rand.choice(["auth", "billing", "search"]),
+                           "msg": rand.choice(["request done", "cache miss",
+                                               "retrying upstream", "user login"]),
+                           "ms": rand.randrange(2000)})
+        lines.append(line)
+        size += len(line) + 1
+    return "\n".join(lines)
+
+
+def run(name, text, lz77):
+    """
+    Compress and decompress text, check the round trip, and
+    return a report line
+    """
+    huffman = Huffman(lz77=lz77)
+    start = time.perf_counter()
+    binary_str = huffman.compress(text)
+    compress_time = time.perf_counter() - start
+    start = time.perf_counter()
+    restored = huffman.decompress(binary_str)
+    decompress_time = time.perf_counter() - start
+    if restored != text:
+        raise AssertionError("{} did not round trip".format(name))
+    ratio = len(binary_str) / 8 / max(1, len(text))
+    return "{:<10} ratio {:.4f}  compress {:8.3f}s {:7.3f} MB/s  decompress {:8.3f}s".format(
+        name, ratio, compress_time, len(text) / compress_time / 1e6, decompress_time)
+
+
+def main(paths):
+    """
+    Print the benchmark for each file, or for the sample log
+    """
+    inputs = [("sample log", sample_log())]
+    if len(paths) > 0:
+        inputs = []
+        for path in paths:
+            with open(path, "rb") as in_file:
+                inputs.append((path, in_file.read().decode("latin-1")))
+    for name, text in inputs:
+        print("{} ({} chars)".format(name, len(text)))
+        print(run("huffman", text, None))
+        for level in sorted(LZ77.LEVELS):
+            print(run("lz77 -{}".format(level), text, LZ77(level=level)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
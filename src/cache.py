@@ -0,0 +1,127 @@
+from collections import OrderedDict
+from hashlib import blake2b
+
+
+class CacheStats:
+    """
+    Hit and miss statistics of a ResultCache
+      - hits: lookups that found a result
+      - misses: lookups that found nothing
+      - evictions: results dropped to stay within the size bounds
+      - entries: results currently cached
+      - size: total size of the cached results
+    """
+    def __init__(self, hits, misses, evictions, entries, size):
+        """
+        Create a CacheStats holding the passed in counts
+        """
+        self.hits = hits
+        self.misses = misses
+        self.evictions = evictions
+        self.entries = entries
+        self.size = size
+
+    def hit_rate(self):
+        """
+        Return the fraction of lookups that were hits
+        """
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return 0.0
+        return self.hits / lookups
+
+    def __str__(self):
+        """
+        Returns a string representation of this CacheStats
+        """
+        return "hits={} misses={} evictions={} entries={} size={}".format(
+            self.hits, self.misses, self.evictions, self.entries, self.size)
+
+
+class ResultCache:
+    """
+    Size bounded LRU cache of compress and encrypt results, keyed by a
+    blake2b hash of the content and whatever else the result depends
+    on (the Vigenere key, the Huffman settings).  Pass a ResultCache to
+    Huffman(cache=...) or Vigenere(key, cache=...); one cache can be
+    shared by several objects.  When a result is added and the cache
+    holds more than max_entries results, or more than max_size in total
+    size, the least recently used results are evicted.
+    """
+    def __init__(self, max_entries=1024, max_size=64 * 1024 * 1024):
+        """
+        Create an empty ResultCache with the passed in bounds
+        """
+        if max_entries < 1 or max_size < 1:
+            raise ValueError("max_entries and max_size must be at least 1")
+        self._max_entries = max_entries
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._size = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def __len__(self):
+        """
+        Returns the number of cached results
+        """
+        return len(self._entries)
+
+    def content_key(self, *parts):
+        """
+        Return the cache key for the passed in string parts.  Each
+        part is hashed with its length, so different splits of the
+        same characters get different keys.
+        """
+        digest = blake2b(digest_size=16)
+        for part in parts:
+            data = part.encode("utf-8", "surrogatepass")
+            digest.update(len(data).to_bytes(8, "big"))
+            digest.update(data)
+        return digest.digest()
+
+    def get(self, key):
+        """
+        Return the result cached for key and mark it as most recently
+        used, or return None when there is no such result
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, value, size):
+        """
+        Cache value, of the passed in size, for key, then evict least
+        recently used results until the cache is within its bounds.
+        A value larger than max_size is not cached.
+        """
+        if size > self._max_size:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._size -= old[1]
+        self._entries[key] = (value, size)
+        self._size += size
+        while len(self._entries) > self._max_entries or self._size > self._max_size:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._size -= evicted[1]
+            self._evictions += 1
+
+    def clear(self):
+        """
+        Remove every cached result, keeping the statistics
+        """
+        self._entries.clear()
+        self._size = 0
+
+    def get_stats(self):
+        """
+        Return a CacheStats with the current statistics
+        """
+        return CacheStats(self._hits, self._misses, self._evictions,
+                          len(self._entries), self._size)
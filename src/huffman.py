@@ -1,7 +1,59 @@
+import re
+from array import array
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import chain, islice
+from math import log2
+
 from huffMap import HuffMap
 from huffTree import HuffTree
 from huffPQ import HuffPQ
 
+DEFAULT_CHUNK_SIZE = 64 * 1024
+
+# Block flag bit at the start of every compressed binary string
+HUFFMAN_BLOCK = "0"
+STORED_BLOCK = "1"
+
+# A stored block holds a 5 bit char width, then every char in that width
+STORED_WIDTH_BITS = 5
+
+# Number of characters sampled for the entropy estimate
+ENTROPY_SAMPLE_SIZE = 4096
+
+# Store the input raw when the estimated entropy (bits per char) is
+# within this many bits of the stored char width
+STORED_MARGIN = 0.25
+
+# An n-gram must occur at least this often to become a symbol
+MIN_NGRAM_COUNT = 2
+
+# Kinds of the (kind, bit length) Huffman symbols for LZ77 matches
+LZ77_LENGTH = "L"
+LZ77_DISTANCE = "D"
+
+# Chars compared at a time when looking for block boundaries
+BLOCK_PROBE_SIZE = 4096
+
+# Estimated cost in bits of the model stored with each block:
+# a fixed part, plus a part for each symbol and its frequency
+BLOCK_HEADER_BITS = 64
+BLOCK_SYMBOL_BITS = 32
+
+# Most bits looked up at once by the table decoder
+DECODE_TABLE_BITS = 12
+
+# Bits decoded by the table decoder between yields
+DECODE_SLICE_BITS = 64 * 1024
+
+# decompress uses the table decoder for Huffman blocks of at least
+# DECODE_TABLE_MIN_BITS bits, with at most one table entry for every
+# DECODE_BITS_PER_ENTRY bits; smaller blocks walk the tree, since
+# building the table would take longer than it saves
+DECODE_TABLE_MIN_BITS = 64 * 1024
+DECODE_BITS_PER_ENTRY = 64
+
 
 class Huffman:
     """
@@ -22,15 +74,79 @@ class Huffman:
            with '0' and right with '1' until you find a leaf node
          - retrieve the file string character from the HuffElement 
            in the HuffNode and add it to the output string.
+      3. Skips the Huffman model for incompressible input:
+         - the entropy of a sample of the file string is estimated
+           before any model is built
+         - when Huffman codes could not beat fixed width chars, the
+           file string is emitted as a stored block instead
+         - the first bit of the binary string flags the block type,
+           so decompress copies stored blocks straight through
+      4. Optionally codes frequent n-grams as single symbols:
+         - with max_ngrams > 0 the most frequent n-grams of the file
+           string are added to the Huffman alphabet
+         - the file string is split into n-gram and single char tokens
+           which are used as the HuffMap keys
+         - each leaf found while decompressing emits its whole token
+      5. Optionally runs an LZ77 pre-stage (see lz77.py):
+         - repeated substrings become (length, distance) matches
+         - literal chars, plus the bit length of every match length
+           and distance, are the symbols of the Huffman alphabet
+         - the bits below the leading 1 of each length and distance
+           follow their Huffman code uncoded
+      6. Optionally caches results in a ResultCache (see cache.py):
+         - compressing the same file string with the same settings
+           again returns the cached binary string and model
+      7. Splits mixed content into independently coded blocks:
+         - the file string is probed in BLOCK_PROBE_SIZE char pieces
+         - a new block starts when coding a piece with its own model
+           saves more bits than that model costs to store
+         - each block holds its own model, so blocks can be decoded
+           in parallel
+      8. Interleaves symbols into independent bitstreams:
+         - symbol i of the file string is coded in stream i mod K,
+           all K streams sharing one model
+         - each stream is decoded with table lookups, and the streams
+           can be decoded in parallel
     """
-    def __init__(self):
+    def __init__(self, profiler=None, stored_margin=STORED_MARGIN,
+                 max_ngrams=0, ngram_size=2, lz77=None, cache=None):
         """
         Constructor: Create the Huffman class object
         Initialize the huff_map instance variable to a HuffMap
         Initialize the huffTree instance variable to None
+        profiler is an optional Profiler that times each stage
+        stored_margin is how close (in bits per char) the estimated
+        entropy must come to the stored char width before the input
+        is stored raw; None always builds the Huffman model.  With lz77
+        the coded tokens are kept unless the stored block is no longer
+        than the coded tokens.
+        max_ngrams is the most n-grams of ngram_size chars added to the
+        Huffman alphabet; 0 codes single characters only
+        lz77 is an optional LZ77 object used as a pre-stage, and
+        cannot be combined with max_ngrams
+        cache is an optional ResultCache for compress results
         """
+        if ngram_size < 2:
+            raise ValueError("ngram_size must be at least 2")
+        if lz77 is not None and max_ngrams > 0:
+            raise ValueError("lz77 cannot be combined with max_ngrams")
         self.huff_map = HuffMap()
         self.huffTree = None
+        self._profiler = profiler
+        self._stored_margin = stored_margin
+        self._max_ngrams = max_ngrams
+        self._ngram_size = ngram_size
+        self._lz77 = lz77
+        self._cache = cache
+
+    def _stage(self, name, bytes_processed):
+        """
+        Return the profiler context for a stage, or a no-op context
+        when no profiler was passed to the constructor
+        """
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.stage(name, bytes_processed)
 
     def build_huff_map(self, file_str):
         """
@@ -38,18 +154,23 @@ class Huffman:
          - keys: file characters
          - values: HuffElements holding character frequency counts
          
-        Loop though each character in the file string
+        file_str may also be a list of tokens from tokenize.
+        Count the characters in the file string, then loop through
+        each distinct character in order of first appearance
           1. If the huffMap does not contain the character, 
              add the character to the map
-          2. Retrieve the HuffElement from the map and increment 
-             the frequency
+          2. Retrieve the HuffElement from the map and add the
+             count to the frequency
+        The HuffMap does a linear search per lookup, so it is only
+        searched once per distinct character, not once per character.
         """
-        for i in range(len(file_str)):
-            if file_str[i] in self.huff_map:
-                elem = self.huff_map.get_huff_elem(file_str[i])
-                elem.inc_freq()
-            else:
-                self.huff_map.add_char(file_str[i])
+        with self._stage("build_huff_map", len(file_str)):
+            for char, count in Counter(file_str).items():
+                if char not in self.huff_map:
+                    self.huff_map.add_char(char)
+                    count -= 1
+                elem = self.huff_map.get_huff_elem(char)
+                elem.set_freq(elem.get_freq() + count)
 
     def build_huff_tree(self):
         """
@@ -67,17 +188,19 @@ class Huffman:
         5. Dequeue the single HuffTree from the HuffPQ 
            and set it to the HuffTree instance variable
         """
-        huff_pq = HuffPQ()      # 1
-        keys = self.huff_map.get_key_set()      # 2
-        for char in keys:       # 3
-            tree = HuffTree(element=self.huff_map.get_huff_elem(char))
-            huff_pq.enqueue(tree)
-        while len(huff_pq) > 1:     # 4
-            left = huff_pq.dequeue()
-            right = huff_pq.dequeue()
-            node = HuffTree(left_tree=left, right_tree=right)
-            huff_pq.enqueue(node)
-        self.huffTree = huff_pq.dequeue()       # 5
+        total_freq = sum(entry.value.get_freq() for entry in self.huff_map)
+        with self._stage("build_huff_tree", total_freq):
+            huff_pq = HuffPQ()      # 1
+            keys = self.huff_map.get_key_set()      # 2
+            for char in keys:       # 3
+                tree = HuffTree(element=self.huff_map.get_huff_elem(char))
+                huff_pq.enqueue(tree)
+            while len(huff_pq) > 1:     # 4
+                left = huff_pq.dequeue()
+                right = huff_pq.dequeue()
+                node = HuffTree(left_tree=left, right_tree=right)
+                huff_pq.enqueue(node)
+            self.huffTree = huff_pq.dequeue()       # 5
 
     def build_huff_codes(self, root):
         """
@@ -87,9 +210,13 @@ class Huffman:
         starting from the root of the Huffman Tree.
         
         If the passed in root is not None, call assign_code
+        A tree with a single leaf gets the code '0' for that leaf
         """
         if root is not None:
-            self.assign_code(root)
+            with self._stage("build_huff_codes", root.get_freq()):
+                if root.left is None:
+                    root.set_code("0")
+                self.assign_code(root)
 
     def assign_code(self, root):
         """
@@ -113,34 +240,297 @@ class Huffman:
             root.right.set_code(root.get_code() + "1")
             self.assign_code(root.right)
 
+    def get_code_dict(self):
+        """
+        Return a dictionary of each HuffMap key to its Huffman code,
+        so codes are not looked up in the HuffMap once per character
+        """
+        return {entry.key: entry.value.get_code() for entry in self.huff_map}
+
     def build_binary_str(self, file_str):
         """
         Builds a binary string of ones and zeros by walking through 
         the passed in file_str and replacing each character with the 
         code in the HuffElement which is retrieved from the HuffMap
+        file_str may also be a list of tokens from tokenize
         Return the binary string
         """
-        binary_str = ""
-        for letter in str(file_str):
-            elem = self.huff_map.get_huff_elem(letter)
-            if elem is not None:
-                binary_str += elem.get_code()
+        with self._stage("build_binary_str", len(file_str)):
+            codes = self.get_code_dict()
+            binary_str = "".join([codes.get(letter, "") for letter in file_str])
         return binary_str
 
+    def get_model(self):
+        """
+        Return the Huffman model as a list of (symbol, frequency)
+        pairs in HuffMap order, which load_model turns back into the
+        same Huffman Tree and codes
+        """
+        return [(entry.key, entry.value.get_freq()) for entry in self.huff_map]
+
+    def load_model(self, model):
+        """
+        Replace the HuffMap with the (symbol, frequency) pairs of a
+        model from get_model, then rebuild the Huffman Tree and codes
+        so binary strings compressed with that model can be decoded
+        """
+        self.huff_map = HuffMap()
+        self.huffTree = None
+        for symbol, freq in model:
+            self.huff_map.add_char(symbol)
+            self.huff_map.get_huff_elem(symbol).set_freq(freq)
+        if len(model) > 0:
+            self.build_huff_tree()
+            self.build_huff_codes(self.huffTree.root)
+
+    def select_ngrams(self, file_str):
+        """
+        Count every n-gram of ngram_size chars in the file string and
+        return the (at most max_ngrams) most frequent ones that occur
+        at least MIN_NGRAM_COUNT times, most frequent first
+        """
+        if self._max_ngrams <= 0 or len(file_str) < self._ngram_size:
+            return []
+        with self._stage("select_ngrams", len(file_str)):
+            shifted = [file_str[i:] for i in range(self._ngram_size)]
+            counts = Counter(map("".join, zip(*shifted)))
+            return [ngram for ngram, count in counts.most_common(self._max_ngrams)
+                    if count >= MIN_NGRAM_COUNT]
+
+    def tokenize(self, file_str, ngrams):
+        """
+        Split the file string into tokens, from left to right taking
+        an n-gram from ngrams when one starts at the current position,
+        otherwise a single char
+        Return the list of tokens
+        """
+        if len(ngrams) == 0:
+            return list(file_str)
+        with self._stage("tokenize", len(file_str)):
+            return self.get_token_pattern(ngrams).findall(file_str)
+
+    def get_token_pattern(self, ngrams):
+        """
+        Return the compiled regular expression used by tokenize,
+        matching any of the ngrams, or else any single char
+        """
+        pattern = "|".join(re.escape(ngram) for ngram in ngrams) + "|."
+        return re.compile(pattern, re.DOTALL)
+
+    def estimate_entropy(self, file_str):
+        """
+        Estimate the entropy of the file string in bits per char from
+        the frequency counts of at most ENTROPY_SAMPLE_SIZE chars,
+        sampled with an even stride across the whole string
+        """
+        step = max(1, -(-len(file_str) // ENTROPY_SAMPLE_SIZE))
+        sample = file_str[::step]
+        with self._stage("estimate_entropy", len(sample)):
+            total = len(sample)
+            entropy = 0.0
+            for count in Counter(sample).values():
+                prob = count / total
+                entropy -= prob * log2(prob)
+        return entropy
+
+    def get_stored_width(self, file_str):
+        """
+        Return the number of bits needed to store each char of the
+        file string in a stored block; at least 1 for a non-empty
+        file string, so a string of only NUL chars is still stored
+        """
+        if len(file_str) == 0:
+            return 0
+        return max(1, ord(max(file_str)).bit_length())
+
+    def use_stored_block(self, file_str):
+        """
+        Return True when the file string should be emitted as a stored
+        block, because Huffman codes are not expected to be shorter
+        than the stored char width
+        """
+        if len(file_str) == 0:
+            return True
+        if self._stored_margin is None:
+            return False
+        width = self.get_stored_width(file_str)
+        return self.estimate_entropy(file_str) + self._stored_margin >= width
+
+    def build_stored_str(self, file_str):
+        """
+        Builds the binary string of a stored block: the char width in
+        STORED_WIDTH_BITS bits followed by every char of the file
+        string in that width
+        Return the binary string
+        """
+        with self._stage("build_stored_str", len(file_str)):
+            width = self.get_stored_width(file_str)
+            if width == 0:
+                return format(0, "0{}b".format(STORED_WIDTH_BITS))
+            char_format = "0{}b".format(width)
+            char_codes = {char: format(ord(char), char_format) for char in set(file_str)}
+            bits = [format(width, "0{}b".format(STORED_WIDTH_BITS))]
+            bits.extend([char_codes[char] for char in file_str])
+            return "".join(bits)
+
     def compress(self, file_str):
         """
         Compresses a passed in string of characters from a text file:
         1. take the passed in file_str and add EOF marker
-        1. build the character frequency map of HuffElements
-        2. build the Huffman Tree using the HuffPQ of HuffTrees
-        3. build the Huffman codes, recursively traversing the tree
-        4. build the Huffman encoded binary string and return it
+        2. estimate the entropy of the file string, and return a
+           stored block when Huffman coding would not pay off
+        3. build the character frequency map of HuffElements
+        4. build the Huffman Tree using the HuffPQ of HuffTrees
+        5. build the Huffman codes, recursively traversing the tree
+        6. build the Huffman encoded binary string and return it
+        The returned binary string starts with the block flag bit
+        Every call builds a new HuffMap.  With a cache, a file string
+        compressed before with the same settings returns the cached
+        binary string and sets the cached HuffMap and Huffman Tree,
+        which are shared with the cache and must not be modified.
         """
         file_str += ""
-        self.build_huff_map(file_str)
+        if self._cache is None:
+            return self.compress_uncached(file_str)
+        with self._stage("cache_lookup", len(file_str)):
+            key = self._cache.content_key("huffman", self.get_settings(), file_str)
+            cached = self._cache.get(key)
+        if cached is not None:
+            binary_str, self.huff_map, self.huffTree = cached
+            return binary_str
+        binary_str = self.compress_uncached(file_str)
+        self._cache.put(key, (binary_str, self.huff_map, self.huffTree), len(binary_str))
+        return binary_str
+
+    def get_settings(self):
+        """
+        Return a string of the settings that change compress output,
+        used in the cache key
+        """
+        lz77 = None
+        if self._lz77 is not None:
+            lz77 = (self._lz77.window_size, self._lz77.level,
+                    self._lz77.min_match, self._lz77.max_match)
+        return repr((self._stored_margin, self._max_ngrams, self._ngram_size, lz77))
+
+    def compress_uncached(self, file_str):
+        """
+        Does the work of compress, starting from a new HuffMap,
+        without looking in the cache
+        """
+        self.huff_map = HuffMap()
+        self.huffTree = None
+        if self._lz77 is not None:
+            return self.compress_lz77(file_str)
+        if self.use_stored_block(file_str):
+            return STORED_BLOCK + self.build_stored_str(file_str)
+        symbols = file_str
+        ngrams = self.select_ngrams(file_str)
+        if len(ngrams) > 0:
+            symbols = self.tokenize(file_str, ngrams)
+        self.build_huff_map(symbols)
+        self.build_huff_tree()
+        self.build_huff_codes(self.huffTree.root)
+        return HUFFMAN_BLOCK + self.build_binary_str(symbols)
+
+    def compress_lz77(self, file_str):
+        """
+        Does the work of compress with the LZ77 pre-stage.  The order-0
+        entropy of the chars says nothing about repeats LZ77 removes,
+        so instead of estimating, the coded tokens are compared with
+        the stored block and the shorter one is kept
+        """
+        if len(file_str) == 0:
+            return STORED_BLOCK + self.build_stored_str(file_str)
+        with self._stage("lz77_encode", len(file_str)):
+            tokens = self._lz77.encode(file_str)
+        self.build_huff_map(self.get_lz77_symbols(tokens))
         self.build_huff_tree()
         self.build_huff_codes(self.huffTree.root)
-        return self.build_binary_str(file_str)
+        binary_str = self.build_lz77_str(tokens)
+        if self._stored_margin is not None:
+            stored_len = STORED_WIDTH_BITS + self.get_stored_width(file_str) * len(file_str)
+            if stored_len <= len(binary_str):
+                self.huff_map = HuffMap()
+                self.huffTree = None
+                return STORED_BLOCK + self.build_stored_str(file_str)
+        return HUFFMAN_BLOCK + binary_str
+
+    def get_lz77_symbols(self, tokens):
+        """
+        Return the list of Huffman symbols for LZ77 tokens: each
+        literal char, and for each match a (LZ77_LENGTH, bit length)
+        and a (LZ77_DISTANCE, bit length) symbol
+        """
+        symbols = []
+        for token in tokens:
+            if isinstance(token, str):
+                symbols.append(token)
+            else:
+                length, distance = token
+                symbols.append((LZ77_LENGTH, length.bit_length()))
+                symbols.append((LZ77_DISTANCE, distance.bit_length()))
+        return symbols
+
+    def build_lz77_str(self, tokens):
+        """
+        Builds the binary string for LZ77 tokens: the code of each
+        literal, and for each match the code of its length symbol and
+        the low bits of the length, then the code of its distance
+        symbol and the low bits of the distance
+        Return the binary string
+        """
+        with self._stage("build_binary_str", len(tokens)):
+            codes = self.get_code_dict()
+            parts = []
+            for token in tokens:
+                if isinstance(token, str):
+                    parts.append(codes[token])
+                    continue
+                for kind, value in zip((LZ77_LENGTH, LZ77_DISTANCE), token):
+                    width = value.bit_length()
+                    parts.append(codes[(kind, width)])
+                    if width > 1:
+                        parts.append(format(value - (1 << (width - 1)), "0{}b".format(width - 1)))
+            return "".join(parts)
+
+    def read_lz77_tokens(self, bits):
+        """
+        Yield the LZ77 tokens coded in an iterator of bits by
+        build_lz77_str, reading the low bits of each match length
+        and distance from the same iterator as the tree walk
+        Raises ValueError when the bits end inside a match, or when
+        a match does not have a length then a distance symbol
+        """
+        symbols = self.walk_tree(bits)
+        for symbol in symbols:
+            if isinstance(symbol, str):
+                yield symbol
+                continue
+            if symbol[0] != LZ77_LENGTH:
+                raise ValueError("corrupt LZ77 stream")
+            length = self.read_lz77_value(bits, symbol[1])
+            symbol = next(symbols, None)
+            if symbol is None:
+                raise ValueError("truncated LZ77 stream")
+            if isinstance(symbol, str) or symbol[0] != LZ77_DISTANCE:
+                raise ValueError("corrupt LZ77 stream")
+            distance = self.read_lz77_value(bits, symbol[1])
+            yield length, distance
+
+    def read_lz77_value(self, bits, width):
+        """
+        Read the width - 1 low bits of a match length or distance
+        from the bits iterator and return the value
+        Raises ValueError when the bits end before the low bits
+        """
+        value = 1 << (width - 1)
+        if width > 1:
+            low_bits = "".join(islice(bits, width - 1))
+            if len(low_bits) < width - 1:
+                raise ValueError("truncated LZ77 stream")
+            value += int(low_bits, 2)
+        return value
 
     def decompress(self, binary_str):
         """
@@ -158,15 +548,431 @@ class Huffman:
            d. Add character to decompressed string
            e. Reset the current node pointer to root
         3. Return the decompressed string
+        The tree walk itself is done by decompress_iter.
+        """
+        with self._stage("decompress", len(binary_str) // 8):
+            return "".join(self.decompress_iter(binary_str, DEFAULT_CHUNK_SIZE))
+
+    def decompress_iter(self, binary_str, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Generator version of decompress: walks the Huffman tree the
+        same way, but yields the decompressed string in chunks of
+        chunk_size characters (the last chunk may be shorter) as soon
+        as each chunk is decoded.  The consumer can stop early, and
+        only one chunk of output is held in memory at a time.
+        A leaf may hold an n-gram, so chunk_len counts chars, not leaves.
+        Large Huffman blocks are decoded with decode_stream_iter
+        instead of one bit at a time.
+        Stored blocks are copied through by decompress_stored_iter.
         """
-        curr_node = self.huffTree.get_root()
-        decompressed_str = ""
-        for i in range(len(binary_str)):
-            if binary_str[i] == "0":
+        if chunk_size < 1:
+            raise ValueError("chunk_size must be at least 1")
+        if len(binary_str) == 0:
+            return
+        if binary_str[0] == STORED_BLOCK:
+            yield from self.decompress_stored_iter(binary_str, chunk_size)
+            return
+        if self._lz77 is not None:
+            tokens = self.read_lz77_tokens(islice(binary_str, 1, None))
+            yield from self._lz77.decode_iter(tokens, chunk_size)
+            return
+        if len(binary_str) >= DECODE_TABLE_MIN_BITS:
+            max_bits = (len(binary_str) // DECODE_BITS_PER_ENTRY).bit_length() - 1
+            parts = self.decode_stream_iter(binary_str, 1,
+                                            self.get_decode_table(min(DECODE_TABLE_BITS, max_bits)))
+        else:
+            parts = [list(self.walk_tree(islice(binary_str, 1, None)))]
+        chunk = []
+        chunk_len = 0
+        for part in parts:
+            chunk.extend(part)
+            chunk_len += sum(map(len, part))
+            if chunk_len >= chunk_size:
+                text = "".join(chunk)
+                whole_len = len(text) - len(text) % chunk_size
+                for chunk_start in range(0, whole_len, chunk_size):
+                    yield text[chunk_start:chunk_start + chunk_size]
+                chunk = [text[whole_len:]]
+                chunk_len = len(text) - whole_len
+        if chunk_len > 0:
+            yield "".join(chunk)
+
+    def walk_tree(self, bits):
+        """
+        Walk the Huffman tree with the passed in bits (0 or 1 chars),
+        going left with '0' and right with '1' from the root, and
+        yield the string held in each leaf node found, resetting to
+        the root after each leaf
+        """
+        root = self.huffTree.get_root()
+        if root.left is None:
+            for bit in bits:
+                if bit == "0" or bit == "1":
+                    yield root.get_char()
+            return
+        curr_node = root
+        for bit in bits:
+            if bit == "0":
                 curr_node = curr_node.left
-            elif binary_str[i] == "1":
+            elif bit == "1":
                 curr_node = curr_node.right
             if curr_node.left is None and curr_node.right is None:
-                decompressed_str += curr_node.get_char()
-                curr_node = self.huffTree.get_root()
-        return decompressed_str
+                yield curr_node.get_char()
+                curr_node = root
+
+    def decompress_stored_iter(self, binary_str, chunk_size=DEFAULT_CHUNK_SIZE):
+        """
+        Yield the chars of a stored block binary string in chunks of
+        chunk_size chars, reading the char width after the flag bit.
+        Each distinct bit string is turned into its char only once.
+        """
+        start = len(STORED_BLOCK) + STORED_WIDTH_BITS
+        width = int(binary_str[len(STORED_BLOCK):start], 2)
+        if width == 0:
+            return
+        chars = {}
+        chunk_bits = chunk_size * width
+        for chunk_start in range(start, len(binary_str), chunk_bits):
+            chunk_end = min(chunk_start + chunk_bits, len(binary_str))
+            codes = [binary_str[pos:pos + width]
+                     for pos in range(chunk_start, chunk_end, width)]
+            for code in set(codes).difference(chars):
+                chars[code] = chr(int(code, 2))
+            yield "".join([chars[code] for code in codes])
+
+    def compress_batch(self, messages):
+        """
+        Compresses a batch of messages with one shared Huffman model:
+        1. replace the HuffMap with a new one, and select n-grams
+           over the whole batch when max_ngrams is set
+        2. build the frequency map, Huffman Tree and codes once,
+           from the characters (or tokens) of every message
+        3. encode every message into one packed binary string,
+           recording where each message starts in an offset index
+        Return a tuple (binary_str, offsets), where offsets is an
+        array of len(messages) + 1 bit positions: message i is coded
+        in binary_str[offsets[i]:offsets[i + 1]].
+        Batches are always Huffman coded, with no block flag bits,
+        and cannot use the LZ77 pre-stage.
+        """
+        if self._lz77 is not None:
+            raise ValueError("compress_batch does not support lz77")
+        messages = list(messages)
+        joined = "".join(messages)
+        self.huff_map = HuffMap()
+        self.huffTree = None
+        ngrams = self.select_ngrams(joined)
+        if len(ngrams) > 0:
+            with self._stage("tokenize", len(joined)):
+                findall = self.get_token_pattern(ngrams).findall
+                symbol_lists = [findall(msg) for msg in messages]
+            self.build_huff_map(list(chain.from_iterable(symbol_lists)))
+        else:
+            symbol_lists = messages
+            self.build_huff_map(joined)
+        self.build_huff_tree()
+        offsets = array("Q", [0])
+        if self.huffTree is None:
+            offsets.extend([0] * len(messages))
+            return "", offsets
+        self.build_huff_codes(self.huffTree.root)
+        with self._stage("build_batch_str", len(joined)):
+            codes = self.get_code_dict()
+            coded_msgs = []
+            position = 0
+            for symbols in symbol_lists:
+                coded = "".join([codes[symbol] for symbol in symbols])
+                coded_msgs.append(coded)
+                position += len(coded)
+                offsets.append(position)
+            binary_str = "".join(coded_msgs)
+        return binary_str, offsets
+
+    def decompress_message(self, binary_str, offsets, index):
+        """
+        Decode message number index of a batch from compress_batch,
+        using only its own bits, and return it
+        """
+        start = offsets[index]
+        end = offsets[index + 1]
+        if start == end:
+            return ""
+        return "".join(self.walk_tree(binary_str[start:end]))
+
+    def decompress_batch(self, binary_str, offsets):
+        """
+        Decode every message of a batch from compress_batch
+        Return the list of messages
+        """
+        with self._stage("decompress_batch", len(binary_str) // 8):
+            return [self.decompress_message(binary_str, offsets, i)
+                    for i in range(len(offsets) - 1)]
+
+    def get_block_settings(self):
+        """
+        Return the constructor arguments that compress_blocks and
+        decompress_blocks use for the Huffman object of each block
+        """
+        return {"stored_margin": self._stored_margin,
+                "max_ngrams": self._max_ngrams,
+                "ngram_size": self._ngram_size,
+                "lz77": self._lz77}
+
+    def find_block_boundaries(self, file_str, probe_size=BLOCK_PROBE_SIZE):
+        """
+        Choose where to split the file string into blocks.
+        The file string is read in probe_size char pieces while the
+        char counts of the current block are kept.  For each piece:
+        1. estimate the bits lost by coding the current block and the
+           piece with one merged model instead of a model each
+        2. if that loss is more than the cost of storing a model for
+           the piece, end the current block and start a new block
+           with the piece counts
+        3. otherwise add the piece counts to the current block counts
+        Return the list of (start, end) char positions of each block
+        """
+        if len(file_str) <= probe_size:
+            return [(0, len(file_str))]
+        with self._stage("find_block_boundaries", len(file_str)):
+            boundaries = []
+            block_start = 0
+            block_counts = Counter(file_str[:probe_size])
+            for start in range(probe_size, len(file_str), probe_size):
+                piece_counts = Counter(file_str[start:start + probe_size])
+                merged_counts = block_counts + piece_counts
+                loss = (get_coded_bits(merged_counts) - get_coded_bits(block_counts)
+                        - get_coded_bits(piece_counts))
+                header = BLOCK_HEADER_BITS + BLOCK_SYMBOL_BITS * len(piece_counts)
+                if loss > header:
+                    boundaries.append((block_start, start))
+                    block_start = start
+                    block_counts = piece_counts
+                else:
+                    block_counts = merged_counts
+            boundaries.append((block_start, len(file_str)))
+        return boundaries
+
+    def compress_blocks(self, file_str, probe_size=BLOCK_PROBE_SIZE):
+        """
+        Split the file string at the boundaries from
+        find_block_boundaries and compress each block with its own
+        Huffman object using the same settings as this one
+        Return the list of (model, binary_str) pairs, one per block,
+        where model is from get_model (empty for a stored block)
+        """
+        blocks = []
+        for start, end in self.find_block_boundaries(file_str, probe_size):
+            huffman = Huffman(profiler=self._profiler, **self.get_block_settings())
+            binary_str = huffman.compress(file_str[start:end])
+            model = []
+            if binary_str[:1] == HUFFMAN_BLOCK:
+                model = huffman.get_model()
+            blocks.append((model, binary_str))
+        return blocks
+
+    def decompress_blocks(self, blocks, workers=1):
+        """
+        Decode the (model, binary_str) blocks from compress_blocks
+        and return the joined file string.  With workers > 1 the
+        blocks are decoded in that many worker processes.
+        """
+        settings = self.get_block_settings()
+        tasks = [(settings, model, binary_str) for model, binary_str in blocks]
+        with self._stage("decompress_blocks", sum(len(task[2]) for task in tasks) // 8):
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    return "".join(pool.map(_decompress_block, tasks))
+            return "".join(map(_decompress_block, tasks))
+
+    def compress_interleaved(self, file_str, streams=4):
+        """
+        Compresses the file string into streams independent bitstreams
+        that share one Huffman model:
+        1. build the frequency map, Huffman Tree and codes from the
+           chars (or n-gram tokens) of the file string
+        2. code symbol i of the file string into stream i mod streams
+        3. join the streams into one binary string, recording where
+           each stream starts in an offset index
+        Return a tuple (binary_str, offsets), where offsets is an
+        array of streams + 1 bit positions: stream j is coded in
+        binary_str[offsets[j]:offsets[j + 1]].
+        Interleaved streams are always Huffman coded, with no block
+        flag bits, and cannot use the LZ77 pre-stage.
+        In one process the streams are decoded one after another, so
+        they only decode faster than decompress when
+        decompress_interleaved spreads them over worker processes.
+        """
+        if streams < 1:
+            raise ValueError("streams must be at least 1")
+        if self._lz77 is not None:
+            raise ValueError("compress_interleaved does not support lz77")
+        self.huff_map = HuffMap()
+        self.huffTree = None
+        symbols = file_str
+        ngrams = self.select_ngrams(file_str)
+        if len(ngrams) > 0:
+            symbols = self.tokenize(file_str, ngrams)
+        self.build_huff_map(symbols)
+        self.build_huff_tree()
+        offsets = array("Q", [0] * (streams + 1))
+        if self.huffTree is None:
+            return "", offsets
+        self.build_huff_codes(self.huffTree.root)
+        with self._stage("build_binary_str", len(symbols)):
+            codes = self.get_code_dict()
+            coded_streams = []
+            for stream in range(streams):
+                coded_streams.append("".join([codes[symbol] for symbol in symbols[stream::streams]]))
+                offsets[stream + 1] = offsets[stream] + len(coded_streams[-1])
+            binary_str = "".join(coded_streams)
+        return binary_str, offsets
+
+    def decompress_interleaved(self, binary_str, offsets, workers=1):
+        """
+        Decode every stream from compress_interleaved with
+        decode_stream, and put the symbols back in file string order:
+        symbol k of stream j was symbol k * streams + j.
+        With workers > 1 the streams are decoded in that many
+        worker processes.  Each worker is sent its stream, one char
+        per bit, and the decode table, so workers only pay off for
+        large inputs on a machine with several cores.
+        Return the decompressed string
+        """
+        streams = len(offsets) - 1
+        if self.huffTree is None or len(binary_str) == 0:
+            return ""
+        with self._stage("decompress_interleaved", len(binary_str) // 8):
+            stream_bits = [binary_str[offsets[j]:offsets[j + 1]] for j in range(streams)]
+            decode_table = self.get_decode_table()
+            if workers > 1 and streams > 1:
+                model = self.get_model()
+                tasks = [(model, decode_table, bits) for bits in stream_bits]
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    decoded = list(pool.map(_decode_stream, tasks))
+            else:
+                decoded = [self.decode_stream(bits, decode_table) for bits in stream_bits]
+            symbols = [""] * sum(len(stream_symbols) for stream_symbols in decoded)
+            for stream, stream_symbols in enumerate(decoded):
+                symbols[stream::streams] = stream_symbols
+            return "".join(symbols)
+
+    def get_decode_table(self, max_bits=DECODE_TABLE_BITS):
+        """
+        Build the lookup table for decode_stream_iter.  width is the
+        longest code length, at most max_bits.  Each width bit
+        string that starts with a whole code maps to (symbols, bits
+        used): the symbols of all the whole codes it starts with, and
+        how many bits those codes use.  A bit string starting with a
+        code longer than width is not in the table.
+        The table for n bits is built from the tables for fewer bits:
+        a code of length l followed by n - l bits decodes to its symbol
+        plus whatever those n - l bits decode to.
+        Return a tuple (table, width)
+        """
+        root = self.huffTree.get_root()
+        if root.left is None:
+            # walk_tree decodes a single leaf from every bit
+            entry = ((root.get_char(),), 1)
+            return {"0": entry, "1": entry}, 1
+        codes = self.get_code_dict()
+        width = min(max_bits, max(len(code) for code in codes.values()))
+        short_codes = [(code, symbol) for symbol, code in codes.items() if len(code) <= width]
+        bit_strings = [[""]]
+        decoded = [{}]
+        for num_bits in range(1, width + 1):
+            bit_strings.append([prefix + bit for prefix in bit_strings[-1] for bit in "01"])
+            level = {}
+            for code, symbol in short_codes:
+                rest_len = num_bits - len(code)
+                if rest_len < 0:
+                    continue
+                rest_table = decoded[rest_len]
+                for rest in bit_strings[rest_len]:
+                    tail = rest_table.get(rest)
+                    if tail is None:
+                        level[code + rest] = ((symbol,), len(code))
+                    else:
+                        level[code + rest] = ((symbol,) + tail[0], len(code) + tail[1])
+            decoded.append(level)
+        return decoded[width], width
+
+    def decode_stream(self, bits, decode_table=None):
+        """
+        Decode one bitstream from compress_interleaved with
+        decode_stream_iter
+        decode_table is the (table, width) tuple from get_decode_table,
+        so it can be built once for every stream; None builds it here
+        Return the list of decoded symbols
+        """
+        symbols = []
+        for part in self.decode_stream_iter(bits, 0, decode_table):
+            symbols.extend(part)
+        return symbols
+
+    def decode_stream_iter(self, bits, start=0, decode_table=None):
+        """
+        Decode the bits from position start by looking up the next
+        width bits in the decode table, which decodes every whole code
+        in those bits at once, instead of walking the tree one bit at
+        a time.  The tree is still walked for codes longer than width
+        and for the last width bits.  A code cut off by the end of the
+        bits is dropped, as walk_tree does.
+        Yield lists of decoded symbols, each from at most
+        DECODE_SLICE_BITS bits
+        """
+        if decode_table is None:
+            decode_table = self.get_decode_table()
+        table, width = decode_table
+        lookup = table.get
+        root = self.huffTree.get_root()
+        end = len(bits)
+        pos = start
+        while pos + width <= end:
+            stop = min(pos + DECODE_SLICE_BITS, end - width + 1)
+            symbols = []
+            extend = symbols.extend
+            while pos < stop:
+                entry = lookup(bits[pos:pos + width])
+                if entry is None:
+                    curr_node = root
+                    while curr_node.left is not None and pos < end:
+                        curr_node = curr_node.left if bits[pos] == "0" else curr_node.right
+                        pos += 1
+                    if curr_node.left is None:
+                        symbols.append(curr_node.get_char())
+                else:
+                    extend(entry[0])
+                    pos += entry[1]
+            yield symbols
+        yield list(self.walk_tree(bits[pos:]))
+
+
+def get_coded_bits(counts):
+    """
+    Return the number of bits needed to code chars with the passed in
+    frequency counts at their entropy: the sum of count * log2(total / count)
+    """
+    total = sum(counts.values())
+    return sum(count * log2(total / count) for count in counts.values())
+
+
+def _decompress_block(task):
+    """
+    Decode one (settings, model, binary_str) block task for
+    Huffman.decompress_blocks, in this or a worker process
+    """
+    settings, model, binary_str = task
+    huffman = Huffman(**settings)
+    huffman.load_model(model)
+    return huffman.decompress(binary_str)
+
+
+def _decode_stream(task):
+    """
+    Decode one (model, decode_table, bits) stream task for
+    Huffman.decompress_interleaved, in a worker process
+    """
+    model, decode_table, bits = task
+    huffman = Huffman()
+    huffman.load_model(model)
+    return huffman.decode_stream(bits, decode_table)
@@ -0,0 +1,142 @@
+class LZ77:
+    """
+    LZ77 sliding window match finder, used as a pre-stage before
+    Huffman coding.  encode turns a string into a list of tokens:
+      - a literal token is a single character string
+      - a match token is a (length, distance) tuple, meaning copy
+        length characters starting distance characters back
+    Matches are found with a hash chain: head maps each string of
+    min_match characters to the last position it started at, and
+    prev links every position to the previous one with the same
+    string.  The effort level (1-9) sets how many chain positions are
+    tried for each match, and the match length that is good enough
+    to stop searching early.
+    """
+
+    # level: (most chain positions tried, match length that stops the search)
+    LEVELS = {
+        1: (4, 8),
+        2: (8, 16),
+        3: (16, 32),
+        4: (32, 64),
+        5: (64, 128),
+        6: (128, 258),
+        7: (256, 258),
+        8: (1024, 258),
+        9: (4096, 258),
+    }
+
+    def __init__(self, window_size=32768, level=6, min_match=3, max_match=258):
+        """
+        Create an LZ77 match finder for matches of min_match to
+        max_match characters at most window_size characters back
+        """
+        if level not in LZ77.LEVELS:
+            raise ValueError("level must be from 1 to 9")
+        if window_size < 1:
+            raise ValueError("window_size must be at least 1")
+        if not 1 <= min_match <= max_match:
+            raise ValueError("min_match must be from 1 to max_match")
+        self.window_size = window_size
+        self.level = level
+        self.min_match = min_match
+        self.max_match = max_match
+        self._max_chain, self._nice_length = LZ77.LEVELS[level]
+
+    def encode(self, text):
+        """
+        Return the list of literal and (length, distance) tokens
+        for the text, taking the longest match found at each position
+        """
+        tokens = []
+        head = {}
+        prev = [-1] * len(text)
+        min_match = self.min_match
+        window_size = self.window_size
+        nice_length = min(self._nice_length, self.max_match)
+        pos = 0
+        while pos < len(text):
+            best_len = 0
+            best_dist = 0
+            if pos + min_match <= len(text):
+                key = text[pos:pos + min_match]
+                max_len = min(self.max_match, len(text) - pos)
+                cand = head.get(key, -1)
+                chain = self._max_chain
+                while cand >= 0 and pos - cand <= window_size and chain > 0:
+                    if best_len < max_len and text[cand + best_len] == text[pos + best_len]:
+                        length = self.match_length(text, cand, pos, max_len)
+                        if length > best_len:
+                            best_len = length
+                            best_dist = pos - cand
+                            if length >= nice_length:
+                                break
+                    cand = prev[cand]
+                    chain -= 1
+                prev[pos] = head.get(key, -1)
+                head[key] = pos
+            if best_len >= min_match:
+                tokens.append((best_len, best_dist))
+                # add the positions inside the match to the hash chains
+                last = min(pos + best_len, len(text) - min_match + 1)
+                for inner in range(pos + 1, last):
+                    key = text[inner:inner + min_match]
+                    prev[inner] = head.get(key, -1)
+                    head[key] = inner
+                pos += best_len
+            else:
+                tokens.append(text[pos])
+                pos += 1
+        return tokens
+
+    def match_length(self, text, cand, pos, max_len):
+        """
+        Return how many characters from cand and pos are the same,
+        up to max_len.  Blocks of characters are compared as slices
+        first, then the last block one character at a time.
+        """
+        length = 0
+        block = 16
+        while length + block <= max_len and \
+                text[cand + length:cand + length + block] == text[pos + length:pos + length + block]:
+            length += block
+        while length < max_len and text[cand + length] == text[pos + length]:
+            length += 1
+        return length
+
+    def decode(self, tokens):
+        """
+        Return the text for a list of tokens from encode
+        """
+        return "".join(self.decode_iter(tokens, 64 * 1024))
+
+    def decode_iter(self, tokens, chunk_size):
+        """
+        Yield the text for the tokens in chunks of chunk_size
+        characters (the last chunk may be shorter).  Only the window
+        of characters that matches can copy from is kept in memory
+        besides the chunk being built.
+        """
+        out = []
+        emitted = 0
+        for token in tokens:
+            if isinstance(token, str):
+                out.append(token)
+            else:
+                length, distance = token
+                start = len(out) - distance
+                if start < 0:
+                    raise ValueError("match distance is before the start of the text")
+                if distance >= length:
+                    out.extend(out[start:start + length])
+                else:
+                    for i in range(length):
+                        out.append(out[start + i])
+            while len(out) - emitted >= chunk_size:
+                yield "".join(out[emitted:emitted + chunk_size])
+                emitted += chunk_size
+            if emitted > 2 * self.window_size:
+                del out[:emitted - self.window_size]
+                emitted = self.window_size
+        if len(out) > emitted:
+            yield "".join(out[emitted:])
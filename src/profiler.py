@@ -0,0 +1,158 @@
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class StageStats:
+    """
+    Holds the measurements for one named stage, such as
+    build_huff_map or decompress.  A Profiler keeps one StageStats per
+    stage adding up every call, and passes a single call StageStats to
+    its callbacks.
+      - calls: number of times the stage ran
+      - wall_time: elapsed wall clock seconds
+      - cpu_time: process CPU seconds
+      - bytes_processed: size of the stage input
+      - peak_memory: largest tracemalloc peak in bytes for one call,
+        above the memory already in use when the call started,
+        or None when memory tracing is off
+    """
+    def __init__(self, name):
+        """
+        Create an empty StageStats for the stage name
+        """
+        self.name = name
+        self.calls = 0
+        self.wall_time = 0.0
+        self.cpu_time = 0.0
+        self.bytes_processed = 0
+        self.peak_memory = None
+
+    def add(self, other_stats):
+        """
+        Add the measurements of other_stats to this StageStats
+        """
+        self.calls += other_stats.calls
+        self.wall_time += other_stats.wall_time
+        self.cpu_time += other_stats.cpu_time
+        self.bytes_processed += other_stats.bytes_processed
+        peak = other_stats.peak_memory
+        if peak is not None and (self.peak_memory is None or peak > self.peak_memory):
+            self.peak_memory = peak
+
+    def throughput(self):
+        """
+        Return the bytes processed per wall clock second
+        """
+        if self.wall_time == 0:
+            return 0.0
+        return self.bytes_processed / self.wall_time
+
+    def as_dict(self):
+        """
+        Return the measurements as a dictionary, for metric systems
+        """
+        return {"name": self.name,
+                "calls": self.calls,
+                "wall_time": self.wall_time,
+                "cpu_time": self.cpu_time,
+                "bytes_processed": self.bytes_processed,
+                "peak_memory": self.peak_memory}
+
+    def __str__(self):
+        """
+        Returns a string representation of this StageStats
+        """
+        peak = "-" if self.peak_memory is None else str(self.peak_memory)
+        return "{}: calls={} wall={:.6f}s cpu={:.6f}s bytes={} peak={}".format(
+            self.name, self.calls, self.wall_time, self.cpu_time,
+            self.bytes_processed, peak)
+
+
+class Profiler:
+    """
+    Opt-in profiler for the Huffman and Vigenere stages.
+    Pass a Profiler to Huffman(profiler=...) or Vigenere(key, profiler=...)
+    and each stage they run records wall time, CPU time, bytes processed
+    and, when trace_memory is True, the tracemalloc peak of the stage.
+    Every callback is called with the StageStats of each single call,
+    so results can be forwarded to a metrics system as they happen.
+    Stages are not nested, so each tracemalloc peak belongs to one stage.
+    """
+    def __init__(self, trace_memory=True, callbacks=None):
+        """
+        Create a Profiler with no recorded stages
+        """
+        self._trace_memory = trace_memory
+        self._callbacks = list(callbacks) if callbacks is not None else []
+        self._stages = {}
+
+    def add_callback(self, callback):
+        """
+        Register callback(stage_stats) to be called after every stage
+        """
+        self._callbacks.append(callback)
+
+    @contextmanager
+    def stage(self, name, bytes_processed=0):
+        """
+        Context manager measuring the code run inside it as stage name
+        """
+        started_tracing = False
+        start_memory = 0
+        if self._trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield
+        finally:
+            record = StageStats(name)
+            record.calls = 1
+            record.wall_time = time.perf_counter() - wall_start
+            record.cpu_time = time.process_time() - cpu_start
+            record.bytes_processed = bytes_processed
+            if self._trace_memory:
+                record.peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+                if started_tracing:
+                    tracemalloc.stop()
+            self._record(record)
+
+    def _record(self, record):
+        """
+        Add a single call StageStats to the totals and run the callbacks
+        """
+        if record.name not in self._stages:
+            self._stages[record.name] = StageStats(record.name)
+        self._stages[record.name].add(record)
+        for callback in self._callbacks:
+            callback(record)
+
+    def get_stats(self):
+        """
+        Return a dictionary of stage name to total StageStats,
+        in the order the stages first ran
+        """
+        return dict(self._stages)
+
+    def get_stage(self, name):
+        """
+        Return the total StageStats for a stage, or None if it never ran
+        """
+        return self._stages.get(name)
+
+    def reset(self):
+        """
+        Forget every recorded stage
+        """
+        self._stages = {}
+
+    def __str__(self):
+        """
+        Returns a report with one line per stage
+        """
+        return "\n".join(str(stats) for stats in self._stages.values())
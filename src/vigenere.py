@@ -23,19 +23,63 @@ a) Find the ciphertext letter in the Vigenere square, using the key
 b) In that same column, get the character at row 0, this is the
    plaintext letter.
 c) Add the plaintext letter to the decoded message.
+
+Because every row of the square is row 0 shifted left by the row index,
+the ciphertext character is simply (message char + key char) mod 128.
+encrypt, decrypt and the batch functions at the bottom of this module
+use that to work from a per-key schedule of byte translate tables
+instead of the square.  Key schedules are kept in an LRU cache shared
+by every Vigenere object, and the square itself is built once at import
+and shared, so creating a Vigenere object allocates no tables.
 """
+import os
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import lru_cache
+from multiprocessing.shared_memory import SharedMemory
+
+# Number of distinct (key, direction) schedules kept in the LRU cache
+KEY_SCHEDULE_CACHE_SIZE = 1024
+
+# Messages shorter than this are not worth starting worker processes for
+PARALLEL_MIN_SIZE = 1024 * 1024
 
 
 class Vigenere:
 
-    def __init__(self, key):
+    def __init__(self, key, profiler=None, cache=None):
         """
         Create Vigenere object: key and matrix
+        profiler is an optional Profiler that times the key lookup
+        and output building stages of encrypt and decrypt
+        cache is an optional ResultCache for encrypt and decrypt
+        results, keyed by the message and the key
         """
         self._key = key
-        self._vig_squ = self.create_vig_square()
+        self._vig_squ = _VIG_SQUARE
+        self._profiler = profiler
+        self._cache = cache
+
+    def _stage(self, name, bytes_processed):
+        """
+        Return the profiler context for a stage, or a no-op context
+        when no profiler was passed to the constructor
+        """
+        if self._profiler is None:
+            return nullcontext()
+        return self._profiler.stage(name, bytes_processed)
 
-    def create_vig_square(self):
+    def get_key_schedule(self, decrypt=False):
+        """
+        Return the translate table for each character of the key from
+        the shared key schedule cache
+        Raises ValueError when the key is empty or not ASCII
+        """
+        with self._stage("key_lookup", len(self._key)):
+            return _key_schedule(self._key, decrypt)
+
+    @staticmethod
+    def create_vig_square():
         """
         Create the vigenere square, using 128 rows and 128 columns
         Use a nested list for the matrix and a nested loop to create 
@@ -63,37 +107,103 @@ class Vigenere:
         """
         Traverse the message getting each letter 
            and finding its encoding:
-        Get the row index of the key char using get_row_index
-        Get the column index of the message char using get_col_index
-        Use the row and column indices to find the code character
-           in the Vigenere square
-        Add code character to encoded message    
-        """
-        coded_msg = ""
-        key_index = 0
-            
-        for ch in msg:
-            row = self.get_row_index(self._key[key_index])
-            col = self.get_col_index(ch)
-            coded_msg = coded_msg + self._vig_squ[row][col]
-            key_index = (key_index + 1) % len(self._key)
-        
-        return coded_msg
+        Get the square row of each key char from the key schedule
+        Every message char matched with the same key char is looked
+           up in that row, one translate call per key char
+        Return the encoded message, from the cache when one was
+           passed in and the message was encrypted before
+        """
+        return self._cached_translate(msg, False)
 
     def decrypt(self, coded_msg):
         """
         Traverse the code getting each letter 
            and finding its decoding:
-        Get the message character using get_plain_text_char 
-        Add message character to decoded message   
+        Get the inverse of the square row of each key char from the
+           decrypt key schedule
+        Every code char matched with the same key char is mapped
+           back to its message char, one translate call per key char
+        Return the decoded message, from the cache when one was
+           passed in and the code was decrypted before
+        """
+        return self._cached_translate(coded_msg, True)
+
+    def _cached_translate(self, msg, decrypt):
+        """
+        Return the cached result for msg when there is one, otherwise
+        translate msg with the key schedule and cache the result
+        """
+        key = None
+        if self._cache is not None:
+            with self._stage("cache_lookup", len(msg)):
+                operation = "decrypt" if decrypt else "encrypt"
+                key = self._cache.content_key(operation, self._key, msg)
+                cached = self._cache.get(key)
+            if cached is not None:
+                return cached
+        schedule = self.get_key_schedule(decrypt)
+        with self._stage("decrypt_output" if decrypt else "encrypt_output", len(msg)):
+            result = _translate(msg, schedule)
+        if key is not None:
+            self._cache.put(key, result, len(result))
+        return result
+
+    def encrypt_parallel(self, msg, workers=None, executor=None):
+        """
+        Encrypt a large message in parallel worker processes.
+        Each code char depends only on its message char and position
+        mod key length, so the message is split into one range per
+        worker, each starting at the right key index.  The workers read
+        and write multiprocessing shared memory, so neither the message
+        nor the result is pickled between processes.
+        workers defaults to the CPU count; an existing executor may be
+        passed in to avoid starting a new process pool on every call.
+        Messages under PARALLEL_MIN_SIZE chars are encrypted serially.
+        """
+        return self._translate_parallel(msg, False, workers, executor)
+
+    def decrypt_parallel(self, coded_msg, workers=None, executor=None):
+        """
+        Decrypt a large message in parallel worker processes,
+        in the same way as encrypt_parallel
         """
-        decoded_msg = ""
-        key_index = 0 
-        for ch in coded_msg:
-            msg_char = self.get_plain_text_char(ch, self._key[key_index])
-            decoded_msg = decoded_msg + msg_char
-            key_index = (key_index + 1) % len(self._key) 
-        return decoded_msg
+        return self._translate_parallel(coded_msg, True, workers, executor)
+
+    def _translate_parallel(self, msg, decrypt, workers, executor):
+        """
+        Copy msg into shared memory, translate one range of it in
+        each worker process and return the translated string
+        """
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 2 or len(msg) < PARALLEL_MIN_SIZE:
+            if decrypt:
+                return self.decrypt(msg)
+            return self.encrypt(msg)
+        self.get_key_schedule(decrypt)
+        data = msg.encode("ascii")
+        size = len(data)
+        step = -(-size // workers)
+        shm_in = SharedMemory(create=True, size=size)
+        shm_out = SharedMemory(create=True, size=size)
+        try:
+            shm_in.buf[:size] = data
+            del data
+            ranges = [(shm_in.name, shm_out.name, start, min(start + step, size),
+                       self._key, decrypt) for start in range(0, size, step)]
+            stage = "decrypt_output" if decrypt else "encrypt_output"
+            with self._stage(stage, size):
+                if executor is None:
+                    with ProcessPoolExecutor(max_workers=workers) as pool:
+                        list(pool.map(_translate_range, *zip(*ranges)))
+                else:
+                    list(executor.map(_translate_range, *zip(*ranges)))
+            return bytes(shm_out.buf[:size]).decode("ascii")
+        finally:
+            shm_in.close()
+            shm_in.unlink()
+            shm_out.close()
+            shm_out.unlink()
 
     def get_col_index(self, char):
         """
@@ -126,3 +236,95 @@ class Vigenere:
         col_index = self._vig_squ[row_index].index(coded_char)
         plain_text_char = self._vig_squ[0][col_index]
         return plain_text_char
+
+
+# One 256 byte translate table per row of the Vigenere square.
+# _ENC_TABLES[shift] maps an ASCII byte to the byte in that row of the
+# square, _DEC_TABLES[shift] is the inverse mapping.  Bytes 128-255 are
+# never looked up because messages are checked to be ASCII first.
+_ENC_TABLES = [bytes((i + shift) % 128 for i in range(256)) for shift in range(128)]
+_DEC_TABLES = [bytes((i - shift) % 128 for i in range(256)) for shift in range(128)]
+
+
+# The Vigenere square shared by every Vigenere object, do not modify
+_VIG_SQUARE = Vigenere.create_vig_square()
+
+
+@lru_cache(maxsize=KEY_SCHEDULE_CACHE_SIZE)
+def _key_schedule(key, decrypt=False):
+    """
+    Return the tuple of translate tables for each character of the key,
+    from _DEC_TABLES when decrypt is True, otherwise from _ENC_TABLES.
+    Results are cached, so each key schedule is built once per process.
+    Raises ValueError when the key is empty or not ASCII.
+    """
+    if len(key) == 0:
+        raise ValueError("Vigenere key must not be empty")
+    tables = _DEC_TABLES if decrypt else _ENC_TABLES
+    return tuple(tables[shift] for shift in key.encode("ascii"))
+
+
+def _translate(msg, schedule):
+    """
+    Encrypt or decrypt msg with the key schedule.
+    Every key_len-th character uses the same row of the square, so each
+    of those strided slices is translated with a single bytes.translate
+    call instead of one table lookup per character.
+    """
+    data = msg.encode("ascii")
+    out = bytearray(len(data))
+    key_len = len(schedule)
+    for i in range(min(key_len, len(data))):
+        out[i::key_len] = data[i::key_len].translate(schedule[i])
+    return out.decode("ascii")
+
+
+def _translate_range(in_name, out_name, start, end, key, decrypt):
+    """
+    Worker for Vigenere._translate_parallel: translate bytes start to
+    end of the in_name shared memory into the out_name shared memory.
+    The char at position p uses the key char at p mod key length.
+    """
+    schedule = _key_schedule(key, decrypt)
+    key_len = len(schedule)
+    shm_in = SharedMemory(name=in_name)
+    shm_out = SharedMemory(name=out_name)
+    in_buf = shm_in.buf
+    out_buf = shm_out.buf
+    try:
+        for key_index in range(key_len):
+            first = start + (key_index - start) % key_len
+            if first < end:
+                chunk = bytes(in_buf[first:end:key_len])
+                out_buf[first:end:key_len] = chunk.translate(schedule[key_index])
+    finally:
+        del in_buf, out_buf
+        shm_in.close()
+        shm_out.close()
+
+
+def _translate_batch(pairs, decrypt):
+    """
+    Translate every (message, key) pair, taking the key schedules
+    from the shared cache
+    """
+    return [_translate(msg, _key_schedule(key, decrypt)) for msg, key in pairs]
+
+
+def encrypt_batch(pairs):
+    """
+    Encrypt a batch of (message, key) pairs, where each message has
+    its own key.  No Vigenere objects or squares are created.
+    Return the list of coded messages in the same order as pairs.
+    Raises ValueError for an empty key or non ASCII message/key chars.
+    """
+    return _translate_batch(pairs, False)
+
+
+def decrypt_batch(pairs):
+    """
+    Decrypt a batch of (coded message, key) pairs.
+    Return the list of decoded messages in the same order as pairs.
+    Raises ValueError for an empty key or non ASCII message/key chars.
+    """
+    return _translate_batch(pairs, True)
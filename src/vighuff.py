@@ -0,0 +1,512 @@
+"""
+Command line tool for Vigenere encryption with Huffman compression.
+
+Run from the src directory as:  python -m vighuff COMMAND [options] [PATH ...]
+
+Commands:
+  compress    Huffman compress each input into a .vhf container
+  decompress  restore the original file from a .vhf container
+  encrypt     Vigenere encrypt each input into a .vig file
+  decrypt     restore the original file from a .vig file
+  pack        encrypt, then compress, into a .vhf container
+  unpack      decompress, then decrypt, a packed .vhf container
+
+Each PATH may be a file or a directory, which is processed recursively.
+With no PATH, or a PATH of '-', stdin is processed to stdout (or to the
+file given with -o).  --jobs N processes up to N files at once, in
+separate processes, and --stats prints a throughput report to stderr.
+
+File bytes are mapped one to one onto chars 0-255 (latin-1), so any
+file can be compressed.  Encryption uses a 128 char Vigenere square,
+so encrypt and pack need 7-bit ASCII input.
+
+Container format (.vhf):
+  4 bytes   magic b"VHUF"
+  1 byte    format version
+  4 bytes   big endian length of the JSON header
+  header    JSON object: "encrypted" (bool), "model" (list of
+            [symbol, frequency] pairs, empty for a stored block),
+            "bits" (number of bits in the payload) and "lz77" (the
+            LZ77 window size, or null when no LZ77 pre-stage was used)
+  payload   the compressed binary string packed 8 bits per byte,
+            zero padded in the last byte
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from huffman import Huffman, HUFFMAN_BLOCK, LZ77_DISTANCE, LZ77_LENGTH, STORED_BLOCK
+from lz77 import LZ77
+from vigenere import Vigenere
+
+MAGIC = b"VHUF"
+FORMAT_VERSION = 1
+CONTAINER_SUFFIX = ".vhf"
+ENCRYPTED_SUFFIX = ".vig"
+RESTORED_SUFFIX = ".out"
+KEY_ENV_VAR = "VIGHUFF_KEY"
+
+# Bytes read per step when streaming encrypt and decrypt
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+# Command name: (suffix of files it reads from a directory, output suffix)
+COMMANDS = {
+    "compress": (None, CONTAINER_SUFFIX),
+    "decompress": (CONTAINER_SUFFIX, RESTORED_SUFFIX),
+    "encrypt": (None, ENCRYPTED_SUFFIX),
+    "decrypt": (ENCRYPTED_SUFFIX, RESTORED_SUFFIX),
+    "pack": (None, CONTAINER_SUFFIX),
+    "unpack": (CONTAINER_SUFFIX, RESTORED_SUFFIX),
+}
+
+
+class CliError(Exception):
+    """
+    Raised for bad input that should be reported without a traceback
+    """
+
+
+def pack_bits(binary_str):
+    """
+    Pack a binary string of '0' and '1' chars into bytes,
+    8 bits per byte, zero padding the last byte
+    """
+    if len(binary_str) == 0:
+        return b""
+    num_bytes = (len(binary_str) + 7) // 8
+    padded = binary_str + "0" * (num_bytes * 8 - len(binary_str))
+    return int(padded, 2).to_bytes(num_bytes, "big")
+
+
+def unpack_bits(data, num_bits):
+    """
+    Unpack the first num_bits bits of data into a binary string
+    """
+    if num_bits == 0:
+        return ""
+    if num_bits > len(data) * 8:
+        raise CliError("container payload is truncated")
+    bits = format(int.from_bytes(data, "big"), "0{}b".format(len(data) * 8))
+    return bits[:num_bits]
+
+
+def write_container(out_file, binary_str, model, encrypted, lz77_window=None):
+    """
+    Write a compressed binary string and its model as a container
+    """
+    header = json.dumps({"encrypted": encrypted,
+                         "model": model,
+                         "bits": len(binary_str),
+                         "lz77": lz77_window}).encode("utf-8")
+    out_file.write(MAGIC)
+    out_file.write(bytes([FORMAT_VERSION]))
+    out_file.write(len(header).to_bytes(4, "big"))
+    out_file.write(header)
+    out_file.write(pack_bits(binary_str))
+
+
+def read_container(data):
+    """
+    Parse container bytes
+    Return a tuple (header dictionary, binary string)
+    Raises CliError when the container is truncated or corrupt
+    """
+    if data[:len(MAGIC)] != MAGIC:
+        raise CliError("not a {} container".format(CONTAINER_SUFFIX))
+    start = len(MAGIC) + 5
+    if len(data) < start:
+        raise CliError("container header is truncated")
+    version = data[len(MAGIC)]
+    if version != FORMAT_VERSION:
+        raise CliError("unsupported container version {}".format(version))
+    header_len = int.from_bytes(data[len(MAGIC) + 1:start], "big")
+    if len(data) < start + header_len:
+        raise CliError("container header is truncated")
+    try:
+        header = json.loads(data[start:start + header_len].decode("utf-8"))
+    except ValueError:
+        raise CliError("container header is corrupt")
+    if (not isinstance(header, dict)
+            or not isinstance(header.get("encrypted"), bool)
+            or not is_count(header.get("bits")) or header["bits"] < 0
+            or not (header.get("lz77") is None or is_count(header["lz77"]) and header["lz77"] > 0)
+            or not isinstance(header.get("model"), list)
+            or not all(is_model_pair(pair, header["lz77"] is not None)
+                       for pair in header["model"])):
+        raise CliError("container header is corrupt")
+    binary_str = unpack_bits(data[start + header_len:], header["bits"])
+    if binary_str[:1] == HUFFMAN_BLOCK and len(header["model"]) == 0:
+        raise CliError("container header is corrupt")
+    return header, binary_str
+
+
+def is_count(value):
+    """
+    Return True when a JSON header value is an int (and not a bool)
+    """
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+def is_model_pair(pair, lz77):
+    """
+    Return True when pair is a [symbol, frequency] model pair with a
+    positive int frequency.  A symbol is a non-empty string or, when
+    lz77 is True, an [LZ77 kind, positive bit length] match symbol.
+    """
+    if not isinstance(pair, list) or len(pair) != 2:
+        return False
+    symbol, freq = pair
+    if not is_count(freq) or freq < 1:
+        return False
+    if isinstance(symbol, str):
+        return len(symbol) > 0
+    return (lz77 and isinstance(symbol, list) and len(symbol) == 2
+            and symbol[0] in (LZ77_LENGTH, LZ77_DISTANCE)
+            and is_count(symbol[1]) and symbol[1] > 0)
+
+
+def get_vigenere(key):
+    """
+    Return a Vigenere object for the key, checking it can be used
+    """
+    if key is None:
+        raise CliError("a key is needed: use --key, --key-file or ${}".format(KEY_ENV_VAR))
+    if len(key) == 0 or not key.isascii():
+        raise CliError("the key must be non-empty 7-bit ASCII")
+    return Vigenere(key)
+
+
+def to_ascii(data):
+    """
+    Decode bytes for the Vigenere cipher, which needs 7-bit ASCII
+    """
+    try:
+        return data.decode("ascii")
+    except UnicodeDecodeError:
+        raise CliError("encryption needs 7-bit ASCII input")
+
+
+def compress_file(in_file, out_file, key, options):
+    """
+    Compress (and encrypt first when key is not None) everything
+    read from in_file into a container written to out_file
+    """
+    text = in_file.read().decode("latin-1")
+    if key is not None:
+        text = get_vigenere(key).encrypt(to_ascii(text.encode("latin-1")))
+    lz77 = None
+    lz77_window = None
+    if options.lz77 is not None:
+        lz77 = LZ77(level=options.lz77)
+        lz77_window = lz77.window_size
+    huffman = Huffman(max_ngrams=options.ngrams, lz77=lz77)
+    binary_str = huffman.compress(text)
+    model = []
+    if binary_str[:1] != STORED_BLOCK:
+        model = huffman.get_model()
+    write_container(out_file, binary_str, model, key is not None, lz77_window)
+
+
+def decompress_file(in_file, out_file, key, options):
+    """
+    Decode a container read from in_file, decrypting it when it was
+    packed, and stream the restored bytes to out_file
+    """
+    header, binary_str = read_container(in_file.read())
+    lz77 = None
+    if header.get("lz77") is not None:
+        lz77 = LZ77(window_size=header["lz77"])
+    huffman = Huffman(lz77=lz77)
+    # JSON turns the (kind, bit length) LZ77 symbols into lists
+    huffman.load_model([(tuple(symbol) if isinstance(symbol, list) else symbol, freq)
+                        for symbol, freq in header["model"]])
+    vigenere = None
+    if header["encrypted"]:
+        vigenere = get_vigenere(key)
+    # Chunks from decompress_iter have equal lengths, so the key stays
+    # aligned when every chunk is a multiple of the key length
+    chunk_size = STREAM_CHUNK_SIZE
+    if vigenere is not None:
+        chunk_size = max(1, chunk_size // len(key)) * len(key)
+    try:
+        for chunk in huffman.decompress_iter(binary_str, chunk_size):
+            if vigenere is not None:
+                chunk = vigenere.decrypt(chunk)
+            out_file.write(chunk.encode("latin-1"))
+    except ValueError as err:
+        raise CliError("container payload is corrupt: {}".format(err))
+
+
+def crypt_file(in_file, out_file, key, decrypt):
+    """
+    Stream in_file through the Vigenere cipher into out_file, reading
+    a multiple of the key length each step so the key stays aligned
+    """
+    vigenere = get_vigenere(key)
+    chunk_size = max(1, STREAM_CHUNK_SIZE // len(key)) * len(key)
+    while True:
+        data = in_file.read(chunk_size)
+        if len(data) == 0:
+            break
+        while len(data) % len(key) != 0:
+            more = in_file.read(len(key) - len(data) % len(key))
+            if len(more) == 0:
+                break
+            data += more
+        text = to_ascii(data)
+        if decrypt:
+            text = vigenere.decrypt(text)
+        else:
+            text = vigenere.encrypt(text)
+        out_file.write(text.encode("ascii"))
+
+
+def run_command(command, in_file, out_file, key, options):
+    """
+    Run a command from in_file to out_file
+    """
+    if command == "compress":
+        compress_file(in_file, out_file, None, options)
+    elif command == "pack":
+        compress_file(in_file, out_file, key, options)
+    elif command in ("decompress", "unpack"):
+        decompress_file(in_file, out_file, key, options)
+    elif command == "encrypt":
+        crypt_file(in_file, out_file, key, False)
+    elif command == "decrypt":
+        crypt_file(in_file, out_file, key, True)
+
+
+def process_file(task):
+    """
+    Run one command on one file, in this or a worker process
+    Return a tuple (in_path, bytes_in, bytes_out, seconds, error)
+    where error is None, or a message when the file failed
+    """
+    command, in_path, out_path, key, options = task
+    start = time.perf_counter()
+    if os.path.exists(out_path) and not options.force:
+        return in_path, 0, 0, 0.0, "{} exists, use --force to overwrite".format(out_path)
+    try:
+        with open(in_path, "rb") as in_file, open(out_path, "wb") as out_file:
+            run_command(command, in_file, out_file, key, options)
+    except (CliError, OSError, ValueError, KeyError) as err:
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        return in_path, 0, 0, time.perf_counter() - start, str(err)
+    seconds = time.perf_counter() - start
+    return in_path, os.path.getsize(in_path), os.path.getsize(out_path), seconds, None
+
+
+def get_output_path(in_path, suffix, input_suffix):
+    """
+    Return the output path for in_path: input_suffix is replaced by
+    suffix when in_path ends with it, otherwise suffix is added
+    """
+    if input_suffix is not None and in_path.endswith(input_suffix):
+        out_path = in_path[:-len(input_suffix)]
+        if suffix == RESTORED_SUFFIX and not os.path.exists(out_path):
+            suffix = ""
+    else:
+        out_path = in_path
+    return out_path + suffix
+
+
+def collect_tasks(command, paths, key, options):
+    """
+    Build the (command, in_path, out_path, key, options) task for every
+    input file, walking directories recursively.  With -o, outputs go
+    into that directory, keeping the paths relative to each input;
+    a single input file may instead be given an -o file name.
+    """
+    input_suffix, suffix = COMMANDS[command]
+    output = options.output
+    if (output is not None and len(paths) == 1 and os.path.isfile(paths[0])
+            and not os.path.isdir(output)):
+        return [(command, paths[0], output, key, options)]
+    tasks = []
+    for path in paths:
+        if os.path.isdir(path):
+            base = os.path.dirname(os.path.abspath(path))
+            for dir_path, dir_names, file_names in os.walk(path):
+                dir_names.sort()
+                for name in sorted(file_names):
+                    if input_suffix is not None and not name.endswith(input_suffix):
+                        continue
+                    if input_suffix is None and name.endswith(suffix):
+                        continue
+                    tasks.append((os.path.join(dir_path, name), base))
+        elif os.path.isfile(path):
+            tasks.append((path, os.path.dirname(os.path.abspath(path))))
+        else:
+            raise CliError("{}: no such file or directory".format(path))
+    result = []
+    for in_path, base in tasks:
+        out_path = get_output_path(in_path, suffix, input_suffix)
+        if output is not None:
+            rel_path = os.path.relpath(os.path.abspath(out_path), base)
+            if rel_path == os.pardir or rel_path.startswith(os.pardir + os.sep):
+                raise CliError("{}: output would be outside {}".format(in_path, output))
+            out_path = os.path.join(output, rel_path)
+            os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+        result.append((command, in_path, out_path, key, options))
+    return result
+
+
+def run_stdin(command, key, options):
+    """
+    Run a command from stdin to stdout, or to the -o file
+    Return a tuple (bytes_in, bytes_out, seconds)
+    """
+    start = time.perf_counter()
+    in_file = CountingReader(sys.stdin.buffer)
+    if options.output is None:
+        out_file = CountingWriter(sys.stdout.buffer)
+        run_command(command, in_file, out_file, key, options)
+        out_file.flush()
+    else:
+        if os.path.exists(options.output) and not options.force:
+            raise CliError("{} exists, use --force to overwrite".format(options.output))
+        try:
+            with open(options.output, "wb") as raw_out:
+                out_file = CountingWriter(raw_out)
+                run_command(command, in_file, out_file, key, options)
+        except (CliError, OSError, ValueError, KeyError):
+            if os.path.exists(options.output):
+                os.remove(options.output)
+            raise
+    return in_file.count, out_file.count, time.perf_counter() - start
+
+
+class CountingReader:
+    """
+    Wraps a binary file, counting the bytes read for --stats
+    """
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def read(self, size=-1):
+        data = self._raw.read(size)
+        self.count += len(data)
+        return data
+
+
+class CountingWriter:
+    """
+    Wraps a binary file, counting the bytes written for --stats
+    """
+    def __init__(self, raw):
+        self._raw = raw
+        self.count = 0
+
+    def write(self, data):
+        self.count += len(data)
+        return self._raw.write(data)
+
+    def flush(self):
+        self._raw.flush()
+
+
+def format_stats(name, bytes_in, bytes_out, seconds):
+    """
+    Return one line of the --stats report
+    """
+    ratio = bytes_out / bytes_in if bytes_in else 0.0
+    rate = bytes_in / seconds / 1e6 if seconds else 0.0
+    return "{}: {} -> {} bytes ({:.3f}) in {:.3f}s, {:.2f} MB/s".format(
+        name, bytes_in, bytes_out, ratio, seconds, rate)
+
+
+def get_key(options):
+    """
+    Return the key from --key, --key-file or the environment, or None
+    """
+    if options.key is not None:
+        return options.key
+    if options.key_file is not None:
+        with open(options.key_file, "r", encoding="ascii") as key_file:
+            return key_file.read().rstrip("\r\n")
+    return os.environ.get(KEY_ENV_VAR)
+
+
+def build_parser():
+    """
+    Return the argparse parser for the command line
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m vighuff",
+        description="Vigenere encryption with Huffman compression")
+    parser.add_argument("command", choices=list(COMMANDS))
+    parser.add_argument("paths", nargs="*", metavar="PATH",
+                        help="files or directories, '-' or none for stdin")
+    parser.add_argument("-o", "--output",
+                        help="output file, or output directory for several inputs")
+    parser.add_argument("-k", "--key", help="Vigenere key")
+    parser.add_argument("--key-file", help="read the Vigenere key from a file")
+    parser.add_argument("-j", "--jobs", type=int, default=1,
+                        help="number of files processed at once")
+    parser.add_argument("--ngrams", type=int, default=0,
+                        help="most n-grams added to the Huffman alphabet")
+    parser.add_argument("--lz77", type=int, choices=range(1, 10), metavar="LEVEL",
+                        help="LZ77 pre-stage effort level, 1 (fast) to 9 (best)")
+    parser.add_argument("-f", "--force", action="store_true",
+                        help="overwrite existing output files")
+    parser.add_argument("--stats", action="store_true",
+                        help="print a throughput report to stderr")
+    return parser
+
+
+def main(argv=None):
+    """
+    Run the command line tool, returning the process exit status
+    """
+    options = build_parser().parse_intermixed_args(argv)
+    if options.jobs < 1:
+        print("vighuff: --jobs must be at least 1", file=sys.stderr)
+        return 2
+    if options.lz77 is not None and options.ngrams > 0:
+        print("vighuff: --lz77 cannot be combined with --ngrams", file=sys.stderr)
+        return 2
+    try:
+        key = get_key(options)
+        if options.command in ("encrypt", "decrypt", "pack"):
+            get_vigenere(key)
+        if len(options.paths) == 0 or options.paths == ["-"]:
+            bytes_in, bytes_out, seconds = run_stdin(options.command, key, options)
+            if options.stats:
+                print(format_stats("<stdin>", bytes_in, bytes_out, seconds), file=sys.stderr)
+            return 0
+        tasks = collect_tasks(options.command, options.paths, key, options)
+    except (CliError, OSError, ValueError, KeyError) as err:
+        print("vighuff: {}".format(err), file=sys.stderr)
+        return 1
+    start = time.perf_counter()
+    if options.jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=options.jobs) as executor:
+            results = list(executor.map(process_file, tasks))
+    else:
+        results = [process_file(task) for task in tasks]
+    status = 0
+    total_in = 0
+    total_out = 0
+    for in_path, bytes_in, bytes_out, seconds, error in results:
+        if error is not None:
+            print("vighuff: {}: {}".format(in_path, error), file=sys.stderr)
+            status = 1
+            continue
+        total_in += bytes_in
+        total_out += bytes_out
+        if options.stats:
+            print(format_stats(in_path, bytes_in, bytes_out, seconds), file=sys.stderr)
+    if options.stats:
+        print(format_stats("total", total_in, total_out, time.perf_counter() - start),
+              file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())